@@ -58,6 +58,7 @@ import numpy as np
 import pandas as pd
 import re
 import numbers
+import functools
 from abc import ABC, abstractmethod
 import tensorflow
 from tensorflow import keras
@@ -69,13 +70,30 @@ from .opencv_utils import imread_rgb, disp_frame
 from .remote_utils import get_remote
 
 
+@functools.lru_cache(maxsize=None)
+def _has_gpu():
+    # looked up on first use, since it initializes tensorflow runtime
+    return len(tensorflow.config.list_logical_devices('GPU')) > 0
+
+def _to_device(x):
+    """
+    Copy a batch to the GPU (if available)
+    When called from the face preprocessing thread, the transfer of the next
+    batch overlaps with the inference of the current batch
+    """
+    if not _has_gpu():
+        return x
+    with tensorflow.device('/GPU:0'):
+        return tensorflow.identity(x)
+
+
 class FaceClassifier(ABC):
     """
     Abstract class to be implemented by face classifiers
     """
 
-    # The 3 properties bellow (input_shape, bbox_scale, bbox2square) are
-    # currently common to all implemented face classifiers
+    # The 4 properties bellow (input_shape, bbox_scale, bbox2square,
+    # needs_alignment) are currently common to all implemented face classifiers
     # they provide information on the face preprocessing steps used for
     # training the classification models
     # in future, they may be defined separately for each classifier using
@@ -93,6 +111,16 @@ class FaceClassifier(ABC):
     #: square containing the detected face
     bbox2square = True
 
+    #: implemented face classifiers were trained on faces rotated such as the
+    #: eyes lie on a horizontal line (FairFace faces were aligned with dlib)
+    #: classifiers trained on non-aligned faces should set it to False,
+    #: avoiding the cost of facial landmark detection
+    needs_alignment = True
+
+    #: if True, inference is compiled for each batch size (XLA). FaceAnalyzer
+    #: then pads incomplete batches to a limited set of sizes
+    jit_compile = False
+
 
     @abstractmethod
     def list2batch(self, limg): pass
@@ -160,13 +188,20 @@ class FaceClassifier(ABC):
         df.insert(0, 'filename', lfiles)
         return df
 
-    def __call__(self, limg, verbose=False):        
+    def __call__(self, limg, verbose=False, bfeats=None):        
         """
         Classify a list of images
         images are supposed to be preprocessed faces: aligned, cropped
         Parameters
         ----------
         limg : list of images, a single image can also be used
+            a batch of images stored in a numpy.ndarray (batch, height, width, depth)
+            can also be used
+        bfeats : result of self.list2batch(limg) or None
+            allows to prepare and copy the next batch of images to the
+            GPU while the current batch is being processed
+            bfeats may contain extra padding images at the end, whose
+            results are discarded
 
         Returns
         -------
@@ -197,14 +232,18 @@ class FaceClassifier(ABC):
         
 
 
-        if isinstance(limg, list):
+        if isinstance(limg, list) or (isinstance(limg, np.ndarray) and limg.ndim == 4):
             islist = True
         else:
             islist = False
             limg = [limg]
 
         assert np.all([e.shape == self.input_shape for e in limg])
-        batch_ret_preds = self.inference(self.list2batch(limg))
+        if bfeats is None:
+            bfeats = self.list2batch(limg)
+        batch_ret_preds = self.inference(bfeats)
+        if len(batch_ret_preds) > len(limg):
+            batch_ret_preds = batch_ret_preds.iloc[:len(limg)].copy()
         batch_ret_preds = self.decisionfunction2labels(batch_ret_preds)
 
         if verbose:
@@ -228,12 +267,40 @@ class Resnet50FairFace(FaceClassifier):
         m = keras.models.load_model(get_remote('keras_resnet50_fairface.h5'), compile=False)
         self.model = tensorflow.keras.Model(inputs=m.inputs, outputs=m.outputs)
 
+    @property
+    def jit_compile(self):
+        # XLA compilation is only profitable on GPU: on CPU, it makes the
+        # first calls and the following ones slower
+        return _has_gpu()
+
     def list2batch(self, limg):
-        x = np.concatenate([np.expand_dims(img_to_array(e), axis=0) for e in limg])
-        return tensorflow.keras.applications.resnet50.preprocess_input(x)
+        # batches are kept as 8 bits images: 4 times less data to be copied
+        # to the GPU than float32 images
+        # normalization is performed on the GPU, within _forward
+        x = np.asarray(limg, dtype=np.uint8)
+        return _to_device(x)
+
+    def _forward(self, x):
+        # model.predict would copy device-resident batches back to the host
+        # a graph function is used instead
+        # the batch dimension is left undefined, avoiding to retrace the
+        # function for each new batch size
+        # XLA compilation fuses operations and is specialized for each
+        # batch size: FaceAnalyzer pads batches to a few sizes only
+        if not hasattr(self, '_forward_fn'):
+            spec = tensorflow.TensorSpec((None,) + self.input_shape, tensorflow.uint8)
+            self._forward_fn = tensorflow.function(self._normalize_forward, input_signature=[spec], jit_compile=self.jit_compile)
+        return self._forward_fn(x)
+
+    def _normalize_forward(self, x):
+        # equivalent to keras.applications.resnet50.preprocess_input ('caffe'
+        # mode): RGB to BGR conversion and ImageNet mean subtraction
+        x = tensorflow.cast(x, tensorflow.float32)[..., ::-1]
+        x = x - tensorflow.constant([103.939, 116.779, 123.68])
+        return self.model(x, training=False)
 
     def inference(self, x):
-        decisions = self.model.predict(x, verbose=0)
+        decisions = self._forward(x).numpy()
         df = pd.DataFrame(decisions.ravel(), columns=['sex_decfunc'])
         return df
 
@@ -276,7 +343,7 @@ class Resnet50FairFaceGRA(Resnet50FairFace):
         self.model = tensorflow.keras.Model(inputs=m.inputs, outputs=m.outputs)
 
     def inference(self, x):
-        gender, _, age = self.model.predict(x, verbose=0)
+        gender, _, age = [e.numpy() for e in self._forward(x)]
         df = pd.DataFrame(zip(gender.ravel(), age.ravel()), columns=['sex_decfunc', 'age_decfunc'])
         return df
 
@@ -316,7 +383,7 @@ class Resnet50FairFaceGRAFull(Resnet50FairFaceGRA):
         self.model = tensorflow.keras.Model(inputs=m.inputs, outputs=m.outputs)
 
     def inference(self, x):
-        gender, race, age = self.model.predict(x, verbose=0)
+        gender, race, age = [e.numpy() for e in self._forward(x)]
         tmp = np.concatenate([gender, age, race], axis=1)
         return pd.DataFrame(tmp, columns= ['sex_decfunc', 'age_decfunc'] + _race_cols)
 
@@ -358,15 +425,19 @@ class OxfordVggFace(FaceClassifier):
 
     def list2batch(self, limg):
         """
-        returns VGG16 Features
+        returns VGG16 input tensor
         limg is a list of preprocessed images supposed to be aligned and cropped and resized to 224*224
         """
         limg = [np.expand_dims(img_to_array(e[:, :, ::-1]), axis=0) for e in limg]
         x = keras_vggface.preprocess_input(np.concatenate(limg))
-        return self.vgg_feature_extractor(x)
+        return _to_device(x)
 
     def inference(self, x):
-        return pd.DataFrame(self.gender_svm.decision_function(x), columns=['sex_decfunc'])
+        """
+        compute VGG16 features and apply SVM
+        """
+        feats = self.vgg_feature_extractor(x)
+        return pd.DataFrame(self.gender_svm.decision_function(feats), columns=['sex_decfunc'])
 
 class Vggface_LSVM_YTF(OxfordVggFace):
     """
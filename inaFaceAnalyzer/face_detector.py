@@ -90,6 +90,11 @@ class FaceDetector(ABC):
     #    def output_type() : pass
     output_type = Detection
 
+    #: True if detection results do not depend on previous calls. Stateless
+    #: detectors can be dispatched on a pool of processes
+    #: (see :class:`inaFaceAnalyzer.inaFaceAnalyzer.FaceAnalyzer`)
+    stateless = False
+
     
     def __init__(self, minconf, min_size_px, min_size_prct, padd_prct):
         """
@@ -126,6 +131,9 @@ class FaceDetector(ABC):
 
         lret = self._call_imp(tmpframe)
 
+        # most video frames contain no face
+        if len(lret) == 0 and not verbose:
+            return lret
 
         # filter detected faces to return only faces with a dimension length
         # (absolute or relative)
@@ -157,6 +165,17 @@ class FaceDetector(ABC):
     @abstractmethod
     def _call_imp(self, frame): pass
 
+    def worker_args(self):
+        """
+        Constructor arguments allowing to build a copy of a stateless detector
+        in face detection processes, using CPU only
+
+        Returns:
+            dict: keyword arguments to be passed to type(self)
+        """
+        return dict(minconf=self.minconf, min_size_px=self.min_size_px,
+                    min_size_prct=self.min_size_prct, padd_prct=self.padd_prct)
+
     def most_central_face(self, frame, contain_center=True, verbose=False):
         """
         To be used for processing ML datasets and training new face classification models.
@@ -266,6 +285,7 @@ class OcvCnnFacedetector(FaceDetector):
     smallest faces but allows to get fast detection time.
     """
     #output_type = Detection
+    stateless = True
 
     def __init__(self, minconf=0.65, min_size_px=30, min_size_prct=0, padd_prct=0.15):
 
@@ -335,18 +355,31 @@ class LibFaceDetection(FaceDetector):
 
     # output_type = DetectionEyes
     #output_type = Detection
+    stateless = True
 
-    def __init__(self, minconf=.98, min_size_px=30, min_size_prct=0, padd_prct=0): 
+    def __init__(self, minconf=.98, min_size_px=30, min_size_prct=0, padd_prct=0, gpu=True):
+        """
+        Args:
+            minconf, min_size_px, min_size_prct, padd_prct: see :class:`FaceDetector`
+            gpu (bool, optional): if False, do not try to use CUDA. Defaults to True.
+        """
         super().__init__(minconf, min_size_px, min_size_prct, padd_prct)
         model_src = get_remote('libfacedetection-yunet.onnx')
+        providers = ['CPUExecutionProvider']
+        if gpu:
+            providers = ['CUDAExecutionProvider'] + providers
         try:
-            self.model = onnxruntime.InferenceSession(model_src, providers=['CUDAExecutionProvider', 'CPUExecutionProvider'])
+            self.model = onnxruntime.InferenceSession(model_src, providers=providers)
         except:
             self.model = onnxruntime.InferenceSession(model_src, providers=['CPUExecutionProvider'])
         self.nms_thresh = 0.3 # Threshold for non-max suppression
         self.keep_top_k = 750 # Keep keep_top_k for results outputing
         self.dprior = {}
 
+    def worker_args(self):
+        # detection processes should not create their own CUDA context
+        return dict(super().worker_args(), gpu=False)
+
     def _call_imp(self, frame):
         bgr_frame = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
         h, w, _ = frame.shape
@@ -410,11 +443,16 @@ class IdentityFaceDetector(FaceDetector):
     already-detected cropped faces.
     """
     #output_type = Detection
+    stateless = True
+
     def __init__(self):
         """
         IdentityFaceDetector Constructor does not require arguments
         """
         super().__init__(0, 0, 0, 0)
+
+    def worker_args(self):
+        return {}
     def _call_imp(self, frame):
         return [Detection(Rect(0, 0, frame.shape[1], frame.shape[0]), np.NAN)]
 
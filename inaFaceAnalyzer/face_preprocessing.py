@@ -42,6 +42,19 @@ def _angle_between_2_points(p1, p2):
         return np.degrees(-np.pi / 2)
 
 
+def _align_crop_matrix(bb, left_eye, right_eye):
+    """
+    Affine matrix (2*3) mapping frame coordinates to the coordinates of the
+    bounding box bb, rotated such as the eyes lie on a horizontal line
+    """
+    angle = _angle_between_2_points(left_eye, right_eye)
+    xc = (left_eye[0] + right_eye[0]) / 2
+    yc = (left_eye[1] + right_eye[1]) / 2
+    M = cv2.getRotationMatrix2D((xc, yc), angle, 1)
+    M += np.array([[0, 0, -bb[0]], [0, 0, -bb[1]]])
+    return M
+
+
 def alignCrop(frame, bb, left_eye, right_eye, verbose=False):
     """
     Rotate image such as the eyes lie on a horizontal line
@@ -62,12 +75,7 @@ def alignCrop(frame, bb, left_eye, right_eye, verbose=False):
     w = int(bb[2] - bb[0])
     h = int(bb[3] - bb[1])
 
-    angle = _angle_between_2_points(left_eye, right_eye)
-    xc = (left_eye[0] + right_eye[0]) / 2
-    yc = (left_eye[1] + right_eye[1]) / 2
-    M = cv2.getRotationMatrix2D((xc, yc), angle, 1)
-    M += np.array([[0, 0, -bb[0]], [0, 0, -bb[1]]])
-
+    M = _align_crop_matrix(bb, left_eye, right_eye)
 
     rotated_frame = cv2.warpAffine(frame, M, (w, h), flags=cv2.INTER_CUBIC)
 
@@ -79,7 +87,124 @@ def alignCrop(frame, bb, left_eye, right_eye, verbose=False):
 
 
 
-def preprocess_face(frame, detection, squarify, bbox_scale, face_alignment, output_shape, verbose=False):
+def normalize_bboxes(lbbox, squarify, bbox_scale):
+    """
+    Apply bounding box normalization to all the faces detected in an image
+    Computations are vectorized using numpy, and provide the same results
+    than methods Rect.square, Rect.scale and Rect.to_int
+
+    Parameters
+    ----------
+    lbbox : list of Rect or numpy.ndarray (nb faces, 4)
+        bounding boxes (x1, y1, x2, y2)
+    squarify: boolean
+        if set to True, bounding boxes are extented to the smallest square
+        containing them
+    bbox_scale: float
+        bounding boxes scaling factor
+
+    Returns
+    -------
+    numpy.ndarray (nb faces, 4) of int
+        normalized bounding boxes
+    """
+    b = np.asarray(lbbox, dtype=np.float64).reshape(-1, 4)
+    p1, p2 = b[:, :2], b[:, 2:]
+
+    if squarify:
+        center = (p1 + p2) / 2
+        offset = np.max(p2 - p1, axis=1, keepdims=True) / 2
+        p1, p2 = center - offset, center + offset
+
+    wh = p2 - p1
+    diff = (wh * bbox_scale - wh) / 2
+    b = np.hstack([p1 - diff, p2 + diff])
+
+    # np.round and python's round both round half to even
+    return np.round(b).astype(int)
+
+
+def face_matrices(bboxes, leyes, output_shape):
+    """
+    Affine matrices allowing to rotate, crop and resize all the faces found
+    in an image, computed with vectorized operations
+    Rotations are equivalent to cv2.getRotationMatrix2D, and resize follows
+    the same pixel center convention than cv2.resize
+
+    Parameters
+    ----------
+    bboxes : numpy.ndarray (nb faces, 4)
+        normalized bounding boxes (see normalize_bboxes)
+    leyes : numpy.ndarray (nb faces, 2, 2) or None
+        if not None, (left_eye, right_eye) positions used to rotate faces such
+        as the eyes lie on a horizontal line
+    output_shape: (width, height) or None
+        if not None, faces will be resized to the provided output shape
+
+    Returns
+    -------
+    numpy.ndarray (nb faces, 2, 3)
+        affine matrices mapping frame coordinates to face coordinates
+    """
+    bboxes = np.asarray(bboxes, dtype=np.float64).reshape(-1, 4)
+    nfaces = len(bboxes)
+    M = np.zeros((nfaces, 2, 3))
+
+    if leyes is None:
+        M[:, 0, 0] = M[:, 1, 1] = 1
+    else:
+        leyes = np.asarray(leyes, dtype=np.float64).reshape(-1, 2, 2)
+        (lx, ly), (rx, ry) = leyes[:, 0].T, leyes[:, 1].T
+        # same angle definition than _angle_between_2_points
+        with np.errstate(divide='ignore', invalid='ignore'):
+            angle = np.arctan((ry - ly) / (rx - lx))
+        angle = np.where(rx != lx, angle, np.where(ry > ly, np.pi / 2, -np.pi / 2))
+        alpha, beta = np.cos(angle), np.sin(angle)
+        xc, yc = (lx + rx) / 2, (ly + ry) / 2
+        M[:, 0, :] = np.stack([alpha, beta, (1 - alpha) * xc - beta * yc], axis=1)
+        M[:, 1, :] = np.stack([-beta, alpha, beta * xc + (1 - alpha) * yc], axis=1)
+
+    # crop
+    M[:, :, 2] -= bboxes[:, :2]
+
+    # resize
+    if output_shape is not None:
+        f = np.asarray(output_shape, dtype=np.float64) / (bboxes[:, 2:] - bboxes[:, :2])
+        M *= f[:, :, np.newaxis]
+        M[:, :, 2] += (f - 1) / 2
+
+    return M
+
+
+def warp_face(frame, M, dsize, out=None):
+    """
+    Apply an affine transformation to a frame, allowing to rotate, crop and
+    resize a face in a single operation. Out of frame areas are set to black
+
+    Parameters
+    ----------
+    frame : numpy nd.array
+        RGB image data
+    M : numpy.ndarray (2, 3)
+        affine matrix (see face_matrices)
+    dsize : (width, height)
+        dimensions of the resulting image
+    out: numpy nd.array (height, width, 3) or None
+        if not None, preallocated array in which the face is written
+
+    Returns
+    -------
+    numpy nd.array : RGB image data
+    """
+    ret = cv2.warpAffine(frame, M, tuple(dsize), dst=out, flags=cv2.INTER_LINEAR)
+    # opencv allocates a new array if out does not match the result type
+    if out is not None and ret is not out:
+        out[...] = ret
+        ret = out
+    return ret
+
+
+def preprocess_face(frame, detection, squarify, bbox_scale, face_alignment, output_shape, verbose=False, out=None):
     """
     Apply preprocessing pipeline to a detected face and returns the
     corresponding image with the following optional processings
@@ -106,6 +231,9 @@ def preprocess_face(frame, detection, squarify, bbox_scale, face_alignment, outp
         estimation of facial landmarks such the eyes lie on a horizontal line
     output_shape: (width, height) or None
         if not None, face will be resized to the provided output shape
+    out: numpy nd.array (height, width, 3) or None
+        if not None, preallocated array in which the resized face is written
+        requires output_shape to be set
     Returns
     -------
     frame: np.array RGB image data
@@ -123,32 +251,24 @@ def preprocess_face(frame, detection, squarify, bbox_scale, face_alignment, outp
     else:
         bbox = detection.bbox
 
+    eyes = None
     if face_alignment is not None:
-        left_eye, right_eye = face_alignment(frame, bbox)
-
-    # if True, extend the bounding box to the smallest square containing
-    # the orignal bounding box
-    if squarify:
-        bbox = bbox.square
+        eyes = face_alignment(frame, bbox)
 
-    # perform bounding box scaling to march larger/smaller areas around
+    # if squarify is True, extend the bounding box to the smallest square
+    # containing the orignal bounding box
+    # then perform bounding box scaling to march larger/smaller areas around
     # the detected face
-    bbox = bbox.scale(bbox_scale)
-
-    bbox = bbox.to_int()
+    bbox = Rect(*normalize_bboxes([bbox], squarify, bbox_scale)[0].tolist())
 
+    # rotation (face alignment based on facial landmark detection), crop
+    # and resize are performed in a single affine transformation
+    M = face_matrices([bbox], None if eyes is None else [eyes], output_shape)[0]
+    if output_shape is None:
+        assert out is None, 'output_shape should be provided together with out'
+        output_shape = (bbox.w, bbox.h)
 
-    # performs face alignment based on facial landmark detection
-    if face_alignment is not None:
-        frame = alignCrop(frame, bbox, left_eye, right_eye, verbose=verbose)
-    else:
-        # crop image to the bounding box
-	# TODO: replace by a wrap affine => management of out of frame
-        frame = frame[bbox.y1:bbox.y2, bbox.x1:bbox.x2]
-
-    # resize image to the required output shape
-    if output_shape is not None:
-        frame = cv2.resize(frame, output_shape)
+    frame = warp_face(frame, M, output_shape, out)
 
     if verbose:
         print('resulting image')
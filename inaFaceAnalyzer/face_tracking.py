@@ -135,6 +135,11 @@ class TrackerDetector:
         if verbose:
             print('update from detection')
 
+        # no face detected: all trackers are removed
+        if len(ldetections) == 0:
+            self.d.clear()
+            return
+
         lkeys = list(self.d.keys())
 
         # compute intersection over union matrix[#tracker, #detected bounding box]
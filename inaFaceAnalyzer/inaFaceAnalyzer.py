@@ -50,15 +50,20 @@ Custom face detection,  face classifier, eye detection and image preprocessing s
 """
 
 
+import functools
+import threading
+import time
+import numpy as np
 import pandas as pd
 from abc import ABC, abstractmethod
-from .opencv_utils import video_iterator, image_iterator, analysisFPS2subsamp_coeff, imwrite_rgb
-from .pyav_utils import video_keyframes_iterator
+from .opencv_utils import video_iterator, imread_rgb, analysisFPS2subsamp_coeff, imwrite_rgb
+from .pyav_utils import video_keyframes_iterator, video_keyframes_seek
 from .face_tracking import TrackerDetector
 from .face_detector import LibFaceDetection, PrecomputedDetector
 from .face_classifier import Resnet50FairFaceGRA
 from .face_alignment import Dlib68FaceAlignment
-from .face_preprocessing import preprocess_face
+from .face_preprocessing import preprocess_face, normalize_bboxes, face_matrices, warp_face
+from .pipeline_utils import ThreadedIterator, detection_pool, pool_detection
 
 
 class FaceAnalyzer(ABC):
@@ -76,7 +81,21 @@ class FaceAnalyzer(ABC):
     # len of batches to be sent to face classifiers
     #batch_len = 32
 
-    def __init__(self, face_detector = None, face_classifier = None, batch_len=32, verbose = False):
+    # maximal amount of decoded frames waiting for face detection
+    # frames are passed by reference between threads and released once
+    # their faces are written in the batch buffers: this bounds the amount
+    # of decoded frames held in memory
+    frame_queue_len = 8
+
+    # maximal amount of preprocessed face batches waiting for classification
+    batch_queue_len = 2
+
+    # delay in seconds after which an incomplete batch of faces is sent to an
+    # idle classifier, if no new face was found. Avoids to wait for a full
+    # batch on streams with few faces
+    flush_delay = 0.5
+
+    def __init__(self, face_detector = None, face_classifier = None, batch_len=32, verbose = False, detection_processes = None):
         """
         Construct a face processing pipeline composed of a face detector, 
             a face preprocessing strategy and a face classifier.
@@ -98,6 +117,13 @@ class FaceAnalyzer(ABC):
             verbose (bool, optional): if True, display several intermediate \
                 images and results - usefull for debugging but should be avoided \
                     in production. Defaults to False.
+            detection_processes (int or None, optional): if set, face detection \
+                is dispatched on a pool of detection_processes processes, \
+                running CPU copies of the face detector. The pool is created \
+                on first use and reused by subsequent analyses. \
+                Only used with stateless face detectors (not with tracking \
+                or precomputed detections). Scripts using this option should \
+                be protected by `if __name__ == '__main__':`. Defaults to None.
 
         """
 
@@ -119,17 +145,30 @@ class FaceAnalyzer(ABC):
         # larger bounding box may help for sex classification from face
         self.bbox_scale = face_classifier.bbox_scale
 
-        # face alignment module
-        self.face_alignment = Dlib68FaceAlignment()
+        # face alignment module, used if the classifier requires aligned faces
+        self.face_alignment = Dlib68FaceAlignment() if face_classifier.needs_alignment else None
 
         # True if some verbose is required
         assert isinstance(verbose, bool)
         self.verbose = verbose
 
+        # number of processes used for face detection
+        assert detection_processes is None or (isinstance(detection_processes, int) and detection_processes > 0)
+        self.detection_processes = detection_processes
+        self._detection_pool = None
+
         # set to large values with large memory GPU for faster processing times !
         assert isinstance(batch_len, int) and batch_len > 0
         self.batch_len = batch_len
 
+        # preallocated buffers receiving preprocessed faces
+        # preprocessed faces are directly written in the buffers, which are
+        # sent to the classifier without further copy
+        # one buffer is filled while another is being classified and the
+        # remaining ones are waiting in the classification queue
+        nbuf = self.batch_queue_len + 2
+        self._batch_buf = np.empty((nbuf, batch_len) + tuple(face_classifier.input_shape), dtype=np.uint8)
+
 
     @abstractmethod
     def __call__(self, src) :
@@ -152,7 +191,141 @@ class FaceAnalyzer(ABC):
         
         pass
 
-    def _process_stream(self, stream_iterator, detector):
+    def _detect_preprocess(self, stream_iterator, oshape, cols, idle=None):
+        """
+        Face detection and preprocessing stage of the analysis pipeline
+
+        Parameters
+        ----------
+        stream_iterator : iterator
+            iterator returning decoded RBG images together with an image
+            identifier and the list of faces detected in the image
+            None elements indicate that the previous stages are stalled
+        oshape : (width, height)
+            dimensions of the preprocessed faces
+        cols : dict of lists
+            columns 'frame', 'bbox' and remaining detection fields, filled
+            with one element per preprocessed face
+        idle : threading.Event or None
+            if set, the classifier waits for a batch: incomplete batches are
+            sent after self.flush_delay seconds without new face
+
+        Yields
+        ------
+        batch : numpy.ndarray (nb faces, height, width, 3)
+            view on the buffer containing the preprocessed faces
+        bfeats : batch converted to classifier's input (see FaceClassifier.list2batch)
+
+        """
+        ibuf = 0
+        batch = self._batch_buf[ibuf]
+        nfaces = 0
+
+        lframe = cols['frame']
+        lbbox = cols['bbox']
+        lfields = [(k, v) for k, v in cols.items() if k not in ['frame', 'bbox']]
+
+        # time of the last face added to the current batch
+        tface = time.monotonic()
+
+        # iterate on image list or video stream
+        for item in stream_iterator:
+
+            # send the incomplete batch if the classifier is idle and no face
+            # was found recently
+            if (idle is not None and nfaces > 0 and idle.is_set()
+                and time.monotonic() - tface > self.flush_delay):
+                yield self._partial_batch(batch, nfaces)
+                ibuf = (ibuf + 1) % len(self._batch_buf)
+                batch = self._batch_buf[ibuf]
+                nfaces = 0
+
+            if item is None:
+                continue
+            iframe, frame, ldetections = item
+
+            if len(ldetections) == 0:
+                continue
+            tface = time.monotonic()
+
+            # bounding boxes of all the faces found in the frame are
+            # normalized at once
+            bboxes = normalize_bboxes([e.bbox for e in ldetections], self.bbox2square, self.bbox_scale)
+
+            lframe.extend([iframe] * len(ldetections))
+            lbbox.extend(map(tuple, bboxes.tolist()))
+            for k, v in lfields:
+                v.extend([getattr(e, k) for e in ldetections])
+
+            # eye detection, and affine matrices allowing to rotate, crop
+            # and resize all the faces of the frame
+            leyes = None
+            if self.face_alignment is not None:
+                leyes = self._detect_eyes(frame, ldetections)
+            matrices = face_matrices(bboxes, leyes, oshape)
+
+            # iterate on detected faces
+            # resulting faces are written in the current batch buffer
+            for M in matrices:
+                warp_face(frame, M, oshape, out=batch[nfaces])
+                nfaces += 1
+
+                # if enough faces were found, send a batch of faces
+                # batch conversion to the classifier's input and copy to the GPU
+                # are done here, while the previous batch is being classified
+                if nfaces == self.batch_len:
+                    yield batch, self.classifier.list2batch(batch)
+                    ibuf = (ibuf + 1) % len(self._batch_buf)
+                    batch = self._batch_buf[ibuf]
+                    nfaces = 0
+
+        if nfaces > 0:
+            yield self._partial_batch(batch, nfaces)
+
+    def _partial_batch(self, batch, nfaces):
+        """
+        Returns the nfaces first faces of batch, and the corresponding
+        classifier's input.
+        For compiled classifiers, classifier's input is padded to the next
+        power of 2, with images remaining in the buffer. They are thus
+        specialized for at most log2(batch_len) + 1 batch sizes, with less
+        than 50% of wasted computations
+        """
+        if not self.classifier.jit_compile:
+            return batch[:nfaces], self.classifier.list2batch(batch[:nfaces])
+        npad = min(self.batch_len, 2 ** int(np.ceil(np.log2(nfaces))))
+        return batch[:nfaces], self.classifier.list2batch(batch[:npad])
+
+    def _detect_eyes(self, frame, ldetections):
+        """
+        Returns the eye positions (left_eye, right_eye) of each detected face,
+        used for face alignment
+        """
+        return [self.face_alignment(frame, e.bbox) for e in ldetections]
+
+    def __del__(self):
+        if getattr(self, '_detection_pool', None) is not None:
+            self._detection_pool.terminate()
+
+    def _get_detection_pool(self, detector):
+        """
+        returns the pool of face detection processes, or None if detection
+        should be performed in the current process
+        """
+        if self.detection_processes is None or not getattr(detector, 'stateless', False):
+            return None
+        # the pool is rebuilt if the detector differs from the one used in
+        # the detection processes
+        key = (type(detector), detector.worker_args())
+        if self._detection_pool is not None and self._detection_pool_key != key:
+            self._detection_pool.terminate()
+            self._detection_pool = None
+        if self._detection_pool is None:
+            self._detection_pool = detection_pool(detector, self.detection_processes)
+            self._detection_pool_key = key
+        return self._detection_pool
+
+    def _process_stream(self, stream_iterator, detector, threaded=True, reader=None):
         """
         Generic pipeline allowing to process image or video streams
         Faces are first detected, preprocessed and sent in batches in
@@ -166,6 +339,16 @@ class FaceAnalyzer(ABC):
             see: opencv_utils.video_iterator, opencv_utils.image_iterator,
             pyav_utils.video_keyframes_iterator
         detector : instance of face_tracking, tracker_detector or face_detector.FaceDetector
+        threaded : bool
+            if True (default), decoding, detection and classification are
+            run in separate threads. Starting the threads has a small cost:
+            set to False when processing streams made of a single image
+            (webcam demo for instance)
+        reader : callable or None
+            if set, stream_iterator returns image sources (file paths) instead
+            of decoded images, and images are decoded using reader(source).
+            When detection is dispatched on a pool of processes, decoding is
+            also performed by these processes
 
         Returns
         -------
@@ -175,44 +358,62 @@ class FaceAnalyzer(ABC):
         """
         oshape = self.classifier.input_shape[:-1]
 
-        lbatch_img = []
-        linfo = []
+        # face information is stored in columns, resulting in a single
+        # dataframe construction at the end of the analysis
+        cols = {'frame': []}
+        for k in detector.output_type._fields:
+            if k != 'eyes':
+                cols[k] = []
         ldf = []
 
-        # iterate on image list or video stream
-        for iframe, frame in stream_iterator:
-
-            # iterate on detected faces
-            for detection in detector(frame, self.verbose):
-
-                # preprocess detected faces: bbox normalization, eye detection, rotation, ...
-                face_img, bbox = preprocess_face(frame, detection, self.bbox2square, self.bbox_scale, self.face_alignment, oshape, False)
-
-                linfo.append([iframe, detection._replace(bbox=tuple(bbox))])
-                # store preprocessed faces in a list, for further batch processing
-                lbatch_img.append(face_img)
-
-            # if enough faces were found, process a batch of faces
-            while len(lbatch_img) > self.batch_len:
-                df = self.classifier(lbatch_img[:self.batch_len], verbose=self.verbose)
+        # decoding, face detection & preprocessing and face classification
+        # are run in 3 threads, allowing the CPU to decode and detect the next
+        # frames while the GPU classifies the current batch of faces
+        # verbose mode displays images with matplotlib, which is not thread safe
+        # face detection may also be dispatched on a pool of processes
+        threaded = threaded and not self.verbose
+        pool = self._get_detection_pool(detector) if threaded else None
+        if reader is not None and pool is None:
+            stream_iterator = ((iframe, reader(src)) for iframe, src in stream_iterator)
+        if not threaded:
+            detections = ((iframe, frame, detector(frame, self.verbose)) for iframe, frame in stream_iterator)
+            batches = self._detect_preprocess(detections, oshape, cols)
+        else:
+            # frames iterators return None if no frame was decoded during
+            # flush_delay, allowing to send incomplete batches
+            if pool is not None:
+                frames = ThreadedIterator(pool_detection(stream_iterator, pool, self.detection_processes, reader), self.frame_queue_len, self.flush_delay)
+                detections = frames
+            else:
+                frames = ThreadedIterator(stream_iterator, self.frame_queue_len, self.flush_delay)
+                detections = (e if e is None else (e[0], e[1], detector(e[1], False)) for e in frames)
+            # set while the classifier is waiting for a batch
+            idle = threading.Event()
+            idle.set()
+            batches = ThreadedIterator(self._detect_preprocess(detections, oshape, cols, idle), self.batch_queue_len)
+
+        try:
+            for batch, bfeats in batches:
+                if threaded:
+                    idle.clear()
+                df = self.classifier(batch, verbose=self.verbose, bfeats=bfeats)
                 ldf.append(df)
-                lbatch_img = lbatch_img[self.batch_len:]
-
-
-        if len(lbatch_img) > 0:
-            df = self.classifier(lbatch_img, verbose=self.verbose)
-            ldf.append(df)
+                if threaded:
+                    idle.set()
+        finally:
+            # upstream stages are stopped first: the detection thread would
+            # otherwise keep decoding frames until it can send a new batch
+            if threaded:
+                frames.close()
+                batches.close()
 
         if len(ldf) == 0:
             return pd.DataFrame(None, columns=(['frame'] + list(detector.output_type._fields) + self.classifier.output_cols))
 
         # return results as a pandas Dataframe
-        df1 = pd.DataFrame({'frame' : [e[0] for e in linfo]})
-        df2 = pd.DataFrame.from_records([e[1] for e in linfo], columns=detector.output_type._fields)
-        if 'eyes' in df2.columns:
-            df2 = df2.drop('eyes', axis=1)
-        df3 = pd.concat(ldf).reset_index(drop=True)
-        return pd.concat([df1, df2, df3], axis = 1)
+        df1 = pd.DataFrame(cols)
+        df2 = pd.concat(ldf, ignore_index=True)
+        return pd.concat([df1, df2], axis = 1)
 
 
 class ImageAnalyzer(FaceAnalyzer):
@@ -245,17 +446,20 @@ class ImageAnalyzer(FaceAnalyzer):
 
         """
         if isinstance(img_paths, str):
-            stream = image_iterator([img_paths], verbose = self.verbose)
+            img_paths = [img_paths]
         else:
-            stream = image_iterator(img_paths, verbose = self.verbose)
-        return self._process_stream(stream, self.face_detector)
+            img_paths = list(img_paths)
+        # images are decoded in detection processes when available
+        stream = ((f, f) for f in img_paths)
+        reader = functools.partial(imread_rgb, verbose=self.verbose)
+        return self._process_stream(stream, self.face_detector, threaded=len(img_paths) > 1, reader=reader)
 
 
 class VideoAnalyzer(FaceAnalyzer):
     """
     Video Analyzer allows to detect and classify faces in video streams
     """
-    def __call__(self, video_path, fps = None,  offset = 0):
+    def __call__(self, video_path, fps = None,  offset = 0, hwaccel = False):
         """
         Pipeline function for face classification from videos (without tracking)
 
@@ -267,13 +471,16 @@ class VideoAnalyzer(FaceAnalyzer):
                 if set to None, all frames are processed (costly)
             offset: float (default: 0)
                 Time in milliseconds to skip at the beginning of the video.
+            hwaccel: bool (default: False)
+                Use hardware video decoding if supported by OpenCV (NVDEC,
+                VA-API, ...). Decoded frames are copied to the CPU.
 
         Returns:
             Dataframe with frame and face information: frame position,
             coordinates, predictions, decision function,labels...
         """
         subsamp_coeff = 1 if fps is None else analysisFPS2subsamp_coeff(video_path, fps)
-        stream = video_iterator(video_path, subsamp_coeff=subsamp_coeff, time_unit='ms', start=max(offset, 0), verbose=self.verbose)
+        stream = video_iterator(video_path, subsamp_coeff=subsamp_coeff, time_unit='ms', start=max(offset, 0), verbose=self.verbose, hwaccel=hwaccel)
         return self._process_stream(stream, self.face_detector)
 
 
@@ -284,18 +491,20 @@ class VideoKeyframes(FaceAnalyzer):
     It allows to provide a video analysis summary in fast processing time, but
     with non uniform frame sampling rate
     """
-    def __call__(self, video_path):
+    def __call__(self, video_path, hwaccel=None):
 
         """
         Pipeline function for face classification from videos, limited to key frames
 
         Parameters:
             video_path (string): Path for input video.
+            hwaccel (string or None): ffmpeg hardware decoding device type \
+                ('cuda', 'vaapi', ...), with fallback to software decoding
         Returns:
             Dataframe with frame and face information: frame position,
             coordinates, predictions, decision function,labels...
         """
-        stream = video_keyframes_iterator(video_path, verbose=self.verbose)
+        stream = video_keyframes_iterator(video_path, verbose=self.verbose, hwaccel=hwaccel)
         return self._process_stream(stream, self.face_detector)
 
     def extract_faces(self, df, video_path, output_dir, oshape=None, bbox_scale=None, ext='png'):
@@ -309,19 +518,23 @@ class VideoKeyframes(FaceAnalyzer):
             bbox_scale = self.bbox_scale
 
 
-        vki = video_keyframes_iterator(video_path, verbose=self.verbose)
-        iframe, frame = next(vki)
+        # faces are grouped by key frame: each required key frame is decoded
+        # once, using random access instead of decoding the whole video
+        # output file names are numbered according to the row order of df
+        dfaces = {}
+        for ituple, (iframe, bbox) in enumerate(zip(df.frame, df.bbox)):
+            dfaces.setdefault(iframe, []).append((ituple, bbox))
+        liframes = sorted(dfaces)
 
-        detector = PrecomputedDetector(list(df.bbox))
-        
-        for ituple, t in enumerate(df.itertuples()):
-            while iframe != t.frame:
-                iframe, frame = next(vki)
-            detection = detector(frame)
-            assert len(detection) == 1, len(detection)
-            detection = detection[0]
-            img, _ = preprocess_face(frame, detection, self.bbox2square, bbox_scale, self.face_alignment, oshape, False)
-            imwrite_rgb('%s/%08d.%s' % (output_dir, ituple, ext), img)
+        detector = PrecomputedDetector([[bbox for _, bbox in dfaces[i]] for i in liframes])
+        out = np.empty((oshape[1], oshape[0], 3), dtype=np.uint8)
+
+        for iframe, frame in video_keyframes_seek(video_path, liframes, verbose=self.verbose):
+            ldetections = detector(frame)
+            assert len(ldetections) == len(dfaces[iframe]), len(ldetections)
+            for (ituple, _), detection in zip(dfaces[iframe], ldetections):
+                img, _ = preprocess_face(frame, detection, self.bbox2square, bbox_scale, self.face_alignment, oshape, False, out=out)
+                imwrite_rgb('%s/%08d.%s' % (output_dir, ituple, ext), img)
 
 
 
@@ -358,7 +571,7 @@ class VideoTracking(FaceAnalyzer):
         super().__init__(face_detector, face_classifier, batch_len=batch_len, verbose=verbose)
         self.detection_period = detection_period
 
-    def __call__(self, video_path, fps = None,  offset = 0):
+    def __call__(self, video_path, fps = None,  offset = 0, hwaccel = False):
         """
         Pipeline function for face classification from videos with tracking
 
@@ -370,6 +583,9 @@ class VideoTracking(FaceAnalyzer):
                 if set to None, all frames are processed (costly)
             offset: float (default: 0)
                 Time in milliseconds to skip at the beginning of the video.
+            hwaccel: bool (default: False)
+                Use hardware video decoding if supported by OpenCV (NVDEC,
+                VA-API, ...). Decoded frames are copied to the CPU.
 
         Returns:
             Dataframe with frame and face information: frame position,
@@ -381,14 +597,38 @@ class VideoTracking(FaceAnalyzer):
             instantaneous ones
         """
         detector = TrackerDetector(self.face_detector, self.detection_period)
+        self._tracked_eyes = {}
 
         subsamp_coeff = 1 if fps is None else analysisFPS2subsamp_coeff(video_path, fps)
-        stream = video_iterator(video_path, subsamp_coeff=subsamp_coeff, time_unit='ms', start=max(offset, 0), verbose=self.verbose)
+        stream = video_iterator(video_path, subsamp_coeff=subsamp_coeff, time_unit='ms', start=max(offset, 0), verbose=self.verbose, hwaccel=hwaccel)
 
         df = self._process_stream(stream, detector)
 
         return self.classifier.average_results(df)
 
+    def _detect_eyes(self, frame, ldetections):
+        """
+        Eye detection is performed on frames where faces were detected
+        On tracked frames, eye positions are obtained from the last detection
+        of the same face, following the displacement of the tracked bounding
+        box
+        """
+        leyes = []
+        for e in ldetections:
+            if e.detect_conf is not None or e.face_id not in self._tracked_eyes:
+                eyes = self.face_alignment(frame, e.bbox)
+                self._tracked_eyes[e.face_id] = (e.bbox, np.asarray(eyes, dtype=np.float64))
+                leyes.append(eyes)
+            else:
+                ref, eyes = self._tracked_eyes[e.face_id]
+                scale = np.array([e.bbox.w / ref.w, e.bbox.h / ref.h])
+                leyes.append((eyes - [ref.x1, ref.y1]) * scale + [e.bbox.x1, e.bbox.y1])
+        # forget lost faces
+        if len(self._tracked_eyes) > len(ldetections):
+            ids = set(e.face_id for e in ldetections)
+            self._tracked_eyes = {k: v for k, v in self._tracked_eyes.items() if k in ids}
+        return leyes
+
 
 
 class VideoPrecomputedDetection(FaceAnalyzer):
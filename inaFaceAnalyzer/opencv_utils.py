@@ -28,11 +28,16 @@ import cv2
 import numpy as np
 import pylab as plt
 
-def video_iterator(src, time_unit='frame', start=None, stop=None, subsamp_coeff=1, verbose=False):
+def video_iterator(src, time_unit='frame', start=None, stop=None, subsamp_coeff=1, verbose=False, hwaccel=False):
 
     # cv2.CAP_PROP_POS_MSEC property was not used because it is buggy
 
-    cap = cv2.VideoCapture(src)
+    if hwaccel:
+        # hardware accelerated decoding if supported by OpenCV's backend
+        # (NVDEC, VA-API, ...), with fallback to software decoding
+        cap = cv2.VideoCapture(src, cv2.CAP_ANY, [cv2.CAP_PROP_HW_ACCELERATION, cv2.VIDEO_ACCELERATION_ANY])
+    else:
+        cap = cv2.VideoCapture(src)
 
     if not cap.isOpened():
         raise Exception("Video file %s does not exist or is invalid" % src)
@@ -0,0 +1,206 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# The MIT License
+
+# Copyright (c) 2021 Ina (David Doukhan - http://www.ina.fr/)
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+Module :mod:`inaFaceAnalyzer.pipeline_utils` contains tools allowing to run
+the stages of the analysis pipeline (decoding, face detection, face
+classification) concurrently.
+"""
+
+import collections
+import multiprocessing
+import queue
+import threading
+import time
+
+# marker sent by producer threads once their iterable is exhausted
+_END = object()
+
+class ThreadedIterator:
+    """
+    Consume an iterable in a background thread and provide its elements
+    through a bounded queue.
+    This allows a producer stage (image decoding, face detection, ...) to run
+    while the consumer stage is busy. OpenCV, PyAV, onnxruntime and tensorflow
+    calls release the GIL, allowing stages to actually overlap.
+    Exceptions raised by the producer are forwarded to the consumer.
+    """
+
+    def __init__(self, iterable, maxsize, timeout=None):
+        """
+        Args:
+            iterable (iterable): elements to be produced in a background thread
+            maxsize (int): maximal number of elements waiting in the queue. \
+                The producer is blocked when the queue is full.
+            timeout (float, optional): if set, None is returned when no \
+                element was produced during timeout seconds, allowing the \
+                consumer to perform other tasks while the producer is \
+                stalled. Defaults to None.
+        """
+        self.queue = queue.Queue(maxsize)
+        self.timeout = timeout
+        self.stop = threading.Event()
+        self.done = False
+        self.thread = threading.Thread(target=self._run, args=(iterable,), daemon=True)
+        self.thread.start()
+
+    def _put(self, item):
+        # returns False if the consumer stopped listening
+        while not self.stop.is_set():
+            try:
+                self.queue.put(item, timeout=.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _run(self, iterable):
+        try:
+            for item in iterable:
+                if not self._put((item, None)):
+                    return
+        except BaseException as e:
+            self._put((_END, e))
+            return
+        finally:
+            # release resources held by generators (process pools, ...)
+            if hasattr(iterable, 'close'):
+                iterable.close()
+        self._put((_END, None))
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.done:
+            raise StopIteration
+        start = time.monotonic()
+        while True:
+            try:
+                item, exc = self.queue.get(timeout=.1)
+                break
+            except queue.Empty:
+                # close was called by another thread: stop waiting
+                if self.stop.is_set():
+                    self.done = True
+                    raise StopIteration
+                if self.timeout is not None and time.monotonic() - start >= self.timeout:
+                    return None
+        if item is _END:
+            self.done = True
+            self.thread.join()
+            if exc is not None:
+                raise exc
+            raise StopIteration
+        return item
+
+    def close(self):
+        """
+        Stop the producer thread. Must be called if the consumer does not
+        iterate until the end of the stream.
+        Consumers blocked in __next__ (possibly in other threads) stop
+        waiting for new elements. When ThreadedIterators are chained, the
+        upstream iterators should be closed first, so that the downstream
+        producers stop pulling elements from them.
+        """
+        self.done = True
+        self.stop.set()
+        self.thread.join()
+
+
+# face detection instance used within detection processes
+_worker_detector = None
+
+def _init_detection_worker(detector_class, kwargs):
+    global _worker_detector
+    _worker_detector = detector_class(**kwargs)
+
+def _detection_worker(frame):
+    return _worker_detector(frame)
+
+def _read_detection_worker(reader, src):
+    frame = reader(src)
+    return frame, _worker_detector(frame)
+
+def detection_pool(detector, nprocs):
+    """
+    Create a pool of processes dedicated to face detection
+    A CPU copy of the detector is instantiated once in each process.
+    Spawned processes import inaFaceAnalyzer (and tensorflow): the pool is
+    costly to create and should be reused across analyses.
+
+    Args:
+        detector (:class:`inaFaceAnalyzer.face_detector.FaceDetector`): \
+            stateless face detection instance, providing worker_args method
+        nprocs (int): number of detection processes
+
+    Returns:
+        multiprocessing.pool.Pool
+    """
+    assert detector.stateless
+    # spawn is used since forking a process using tensorflow or CUDA is unsafe
+    ctx = multiprocessing.get_context('spawn')
+    return ctx.Pool(nprocs, initializer=_init_detection_worker,
+                    initargs=(type(detector), detector.worker_args()))
+
+def pool_detection(stream_iterator, pool, nprocs, reader=None):
+    """
+    Perform face detection on a stream of images using a pool of processes.
+    Detection is dispatched on several frames simultaneously, which is usefull
+    for face detectors running on a single CPU core.
+
+    Args:
+        stream_iterator (iterator): iterator returning decoded RGB images \
+            together with an image identifier
+        pool (multiprocessing.pool.Pool): pool returned by :func:`detection_pool`
+        nprocs (int): number of processes in the pool
+        reader (callable, optional): if set, stream_iterator returns image \
+            sources (file paths, ...) instead of decoded images, and images \
+            are decoded by the detection processes using reader(source). \
+            reader should be picklable. Defaults to None.
+
+    Yields:
+        (image identifier, image, list of detections), in the stream order
+    """
+    def submit(src):
+        if reader is None:
+            return src, pool.apply_async(_detection_worker, (src,))
+        return None, pool.apply_async(_read_detection_worker, (reader, src))
+
+    def result(frame, ret):
+        if reader is None:
+            return frame, ret.get()
+        return ret.get()
+
+    # limit the amount of frames being processed to bound memory usage
+    pending = collections.deque()
+    for iframe, src in stream_iterator:
+        pending.append((iframe, *submit(src)))
+        if len(pending) >= 2 * nprocs:
+            iframe, frame, ret = pending.popleft()
+            yield (iframe, *result(frame, ret))
+    while pending:
+        iframe, frame, ret = pending.popleft()
+        yield (iframe, *result(frame, ret))
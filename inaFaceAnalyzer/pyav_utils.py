@@ -24,14 +24,42 @@
 # THE SOFTWARE.
 
 import os
+import warnings
 import av
 import av.datasets
 from .opencv_utils import disp_frame
 
-def video_keyframes_iterator(video_path, verbose=False):
-
+def _open(video_path, hwaccel):
     content = av.datasets.curated(os.path.abspath(video_path))
-    with av.open(content) as container:
+    if hwaccel is None:
+        return av.open(content)
+    # decoded frames are downloaded to the CPU: detection and preprocessing
+    # are performed on CPU images
+    # HWAccel is available in PyAV >= 14
+    from av.codec.hwaccel import HWAccel
+    try:
+        return av.open(content, hwaccel=HWAccel(device_type=hwaccel, allow_software_fallback=True))
+    except av.FFmpegError as e:
+        warnings.warn('hardware decoding unavailable (%s), using software decoding' % e)
+        return av.open(content)
+
+def video_keyframes_iterator(video_path, verbose=False, hwaccel=None):
+    """
+    Decode video key frames
+
+    Parameters
+    ----------
+    video_path : str
+        Path to input video.
+    hwaccel : str or None
+        if not None, ffmpeg hardware decoding device type ('cuda', 'vaapi',
+        'videotoolbox', ...), with fallback to software decoding
+
+    Yields
+    ------
+    (key frame position, RGB image)
+    """
+    with _open(video_path, hwaccel) as container:
         # Signal that we only want to look at keyframes.
         stream = container.streams.video[0]
         stream.codec_context.skip_frame = 'NONKEY'
@@ -43,3 +71,43 @@ def video_keyframes_iterator(video_path, verbose=False):
                 print('frame', iframe)
                 disp_frame(ndframe)
             yield iframe, ndframe
+
+
+def video_keyframes_seek(video_path, liframes, verbose=False, hwaccel=None):
+    """
+    Decode a subset of video key frames using random access
+    For each requested key frame, the container is seeked to the nearest
+    preceding key frame, avoiding to decode the whole video
+
+    Parameters
+    ----------
+    video_path : str
+        Path to input video.
+    liframes : list of int
+        sorted key frame positions, as returned by video_keyframes_iterator
+    hwaccel : str or None
+        hardware decoding device type (see video_keyframes_iterator)
+
+    Yields
+    ------
+    (key frame position, RGB image)
+    """
+    with _open(video_path, hwaccel) as container:
+        stream = container.streams.video[0]
+        stream.codec_context.skip_frame = 'NONKEY'
+
+        for target in liframes:
+            # seek is backward: decoding starts at a key frame <= target
+            container.seek(int(target), stream=stream)
+            iframe = None
+            for frame in container.decode(stream):
+                iframe = int(frame.time/frame.time_base)
+                if iframe >= target:
+                    break
+            if iframe != target:
+                raise ValueError('frame %s is not a key frame of %s' % (target, video_path))
+            ndframe = frame.to_rgb().to_ndarray()
+            if verbose:
+                print('frame', iframe)
+                disp_frame(ndframe)
+            yield iframe, ndframe
@@ -58,7 +58,8 @@ while True:
 
     gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
 
-    faces = gi._process_stream([(iframe, frame)], detector)
+    # a single frame is processed: the threaded pipeline would not help
+    faces = gi._process_stream([(iframe, frame)], detector, threaded=False)
 
     # Draw a rectangle around the faces
     for e in faces.itertuples():
@@ -38,6 +38,10 @@ from tests.tracking import TestTracking
 from tests.detector import TestDetector
 # here are remaining framework tests
 from tests.video import TestVideo
+# face preprocessing tests
+from tests.preprocessing import TestPreprocessing
+# threads and processes used in the analysis pipeline
+from tests.pipeline import TestPipeline
 
 if __name__ == '__main__':
     unittest.main()
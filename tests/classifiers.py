@@ -112,6 +112,33 @@ class TestClassifiers(unittest.TestCase):
         np.testing.assert_almost_equal([d1[0]] * 32, d1, decimal=3)
         np.testing.assert_almost_equal([d2[0]] * 32, d2, decimal=3)
 
+    def test_batch_array_bfeats(self):
+        # batches may be provided as arrays, with precomputed network inputs
+        limg = [imread_rgb('./media/diallo224.jpg'), imread_rgb('./media/knuth224.jpg')]
+        for c in [Resnet50FairFaceGRA(), Vggface_LSVM_YTF()]:
+            refdf = c(limg)
+            batch = np.array(limg)
+            retdf = c(batch, bfeats=c.list2batch(batch))
+            self.assertEqual(list(refdf.columns), list(retdf.columns))
+            for col in refdf.columns:
+                if col.endswith('_decfunc'):
+                    np.testing.assert_almost_equal(refdf[col], retdf[col], decimal=5)
+                else:
+                    self.assertSequenceEqual(list(refdf[col]), list(retdf[col]))
+
+    def test_resnet_normalization(self):
+        # normalization performed within _forward should match keras
+        # resnet50 preprocessing applied to the uint8 batch, with and
+        # without XLA compilation
+        batch = np.random.randint(0, 256, (3, 224, 224, 3)).astype(np.uint8)
+        ref = tf.keras.applications.resnet50.preprocess_input(batch.astype(np.float32))
+        for jit_compile in [False, True]:
+            cls = type('Resnet', (Resnet50FairFace,), {'jit_compile': jit_compile})
+            c = cls.__new__(cls)
+            c.model = lambda x, training: x
+            ret = c._forward(c.list2batch(list(batch))).numpy()
+            np.testing.assert_allclose(ref, ret, atol=1e-4)
+
     def test_racelayerdeleted(self):
         # test if "race" prediction layer is set to NaN in the public distribution
         c = Resnet50FairFaceGRA()
@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# The MIT License
+
+# Copyright (c) 2021 Ina (David Doukhan - http://www.ina.fr/)
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import time
+import unittest
+import numpy as np
+import pandas as pd
+from pandas.testing import assert_frame_equal
+from inaFaceAnalyzer.pipeline_utils import ThreadedIterator, detection_pool, pool_detection
+from inaFaceAnalyzer.inaFaceAnalyzer import ImageAnalyzer
+from inaFaceAnalyzer.face_classifier import FaceClassifier
+from inaFaceAnalyzer.face_detector import Detection
+from inaFaceAnalyzer.rect import Rect
+
+
+class DoubleDetector:
+    """
+    Fake stateless detector used to test the detection pool
+    """
+    stateless = True
+    def __init__(self, factor=2):
+        self.factor = factor
+    def worker_args(self):
+        return {'factor': self.factor}
+    def __call__(self, frame):
+        return [frame * self.factor]
+
+
+class SparseDetector:
+    """
+    Fake detector returning a face for frames with non zero values
+    """
+    output_type = Detection
+    def __call__(self, frame, verbose=False):
+        if frame[0, 0, 0] == 0:
+            return []
+        return [Detection(Rect(2, 2, 14, 14), float(frame[0, 0, 0]))]
+
+
+class MeanClassifier(FaceClassifier):
+    """
+    Fake classifier returning the mean value of faces
+    """
+    input_shape = (8, 8, 3)
+    needs_alignment = False
+    def __init__(self, fail=False, jit_compile=False):
+        self.fail = fail
+        self.jit_compile = jit_compile
+        self.batch_sizes = []
+    def list2batch(self, limg):
+        return np.asarray(limg, dtype=np.float32)
+    def inference(self, x):
+        if self.fail:
+            raise ValueError('classifier failure')
+        self.batch_sizes.append(len(x))
+        return pd.DataFrame(x.mean(axis=(1, 2, 3)), columns=['mean_decfunc'])
+    def decisionfunction2labels(self, df):
+        return df
+
+
+def _frames(lfaces, delay=0):
+    """
+    Generate 16*16 frames, containing a face if lfaces[i] is True
+    """
+    for i, face in enumerate(lfaces):
+        time.sleep(delay)
+        yield i, np.full((16, 16, 3), i % 250 + 1 if face else 0, dtype=np.uint8)
+
+
+def _slow_gen():
+    yield 1
+    time.sleep(.5)
+    yield 2
+
+
+def _slow_range(n):
+    for i in range(n):
+        time.sleep(.01)
+        yield i
+
+
+def _failing_gen():
+    yield 1
+    raise ValueError('producer failure')
+
+
+class TestPipeline(unittest.TestCase):
+
+    def test_threaded_iterator_order(self):
+        frames = ThreadedIterator(range(100), 3)
+        doubled = ThreadedIterator((2 * e for e in frames), 2)
+        self.assertEqual(list(doubled), [2 * e for e in range(100)])
+        self.assertFalse(frames.thread.is_alive())
+        self.assertFalse(doubled.thread.is_alive())
+
+    def test_threaded_iterator_exception(self):
+        it = ThreadedIterator(_failing_gen(), 2)
+        self.assertEqual(next(it), 1)
+        with self.assertRaises(ValueError):
+            next(it)
+        self.assertFalse(it.thread.is_alive())
+
+    def test_threaded_iterator_close(self):
+        frames = ThreadedIterator(range(10000), 3)
+        doubled = ThreadedIterator((2 * e for e in frames), 2)
+        self.assertEqual(next(doubled), 0)
+        doubled.close()
+        frames.close()
+        self.assertFalse(frames.thread.is_alive())
+        self.assertFalse(doubled.thread.is_alive())
+        with self.assertRaises(StopIteration):
+            next(doubled)
+
+    def test_threaded_iterator_close_stalled(self):
+        frames = ThreadedIterator(_slow_range(300), 3)
+        # no element reaches the consumer, as with videos without faces
+        faces = ThreadedIterator((e for e in frames if e < 0), 2)
+        time.sleep(.1)
+        start = time.monotonic()
+        frames.close()
+        faces.close()
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertFalse(frames.thread.is_alive())
+        self.assertFalse(faces.thread.is_alive())
+
+    def test_classifier_failure(self):
+        # the analysis should stop without decoding the face-free remaining frames
+        gi = ImageAnalyzer(face_detector=SparseDetector(), face_classifier=MeanClassifier(fail=True), batch_len=4)
+        start = time.monotonic()
+        with self.assertRaises(ValueError):
+            gi._process_stream(_frames([True] * 4 + [False] * 300, .01), gi.face_detector)
+        self.assertLess(time.monotonic() - start, 1.5)
+
+    def test_padded_batches(self):
+        for jit_compile, sizes in [(False, [8, 5]), (True, [8, 8])]:
+            classif = MeanClassifier(jit_compile=jit_compile)
+            gi = ImageAnalyzer(face_detector=SparseDetector(), face_classifier=classif, batch_len=8)
+            df = gi._process_stream(_frames([True] * 13), gi.face_detector)
+            self.assertEqual(classif.batch_sizes, sizes)
+            # padding results are discarded
+            self.assertEqual(list(df.frame), list(range(13)))
+            np.testing.assert_array_equal(df.mean_decfunc, np.arange(1, 14))
+
+    def test_flush_incomplete_batch(self):
+        lfaces = [True] * 3 + [False] * 2 + [True] * 3
+        classif = MeanClassifier()
+        gi = ImageAnalyzer(face_detector=SparseDetector(), face_classifier=classif, batch_len=8)
+        gi.flush_delay = .1
+        nbatches_at_stall = []
+        def stream():
+            for i, frame in _frames(lfaces):
+                if i == 3:
+                    # decoding stalls: the 3 first faces should be classified
+                    time.sleep(.5)
+                    nbatches_at_stall.append(len(classif.batch_sizes))
+                yield i, frame
+        df = gi._process_stream(stream(), gi.face_detector)
+        self.assertEqual(nbatches_at_stall, [1])
+        self.assertEqual(classif.batch_sizes, [3, 3])
+        ref = gi._process_stream(_frames(lfaces), gi.face_detector, threaded=False)
+        assert_frame_equal(ref, df)
+
+    def test_threaded_iterator_timeout(self):
+        it = ThreadedIterator(_slow_gen(), 2, timeout=.1)
+        ret = [e for e in it]
+        self.assertEqual(ret[0], 1)
+        self.assertEqual(ret[-1], 2)
+        self.assertIn(None, ret)
+        self.assertEqual(set(ret), {1, 2, None})
+
+    def test_pool_detection_order(self):
+        pool = detection_pool(DoubleDetector(3), 3)
+        try:
+            ret = list(pool_detection(((i, i) for i in range(50)), pool, 3))
+        finally:
+            pool.terminate()
+        self.assertEqual(ret, [(i, i, [3 * i]) for i in range(50)])
+
+    def test_analyzer_detection_pool(self):
+        gi = ImageAnalyzer(face_detector=SparseDetector(), face_classifier=MeanClassifier(), detection_processes=1)
+        try:
+            pool = gi._get_detection_pool(DoubleDetector(2))
+            self.assertIs(pool, gi._get_detection_pool(DoubleDetector(2)))
+            # a new pool is created for a different detector
+            pool = gi._get_detection_pool(DoubleDetector(3))
+            self.assertEqual(list(pool_detection([(0, 5)], pool, 1)), [(0, 5, [15])])
+        finally:
+            gi._detection_pool.terminate()
+
+    def test_pool_detection_close(self):
+        pool = detection_pool(DoubleDetector(), 2)
+        try:
+            it = pool_detection(((i, i) for i in range(1000)), pool, 2)
+            self.assertEqual(next(it), (0, 0, [0]))
+            it.close()
+            # the pool remains usable after an interrupted analysis
+            ret = list(pool_detection(((i, i) for i in range(5)), pool, 2))
+            self.assertEqual(ret, [(i, i, [2 * i]) for i in range(5)])
+        finally:
+            pool.terminate()
+
+    def test_pool_detection_reader(self):
+        pool = detection_pool(DoubleDetector(), 2)
+        try:
+            # images are "decoded" by the detection processes
+            ret = list(pool_detection((('img%d' % i, i) for i in range(20)), pool, 2, reader=abs))
+        finally:
+            pool.terminate()
+        self.assertEqual(ret, [('img%d' % i, i, [2 * i]) for i in range(20)])
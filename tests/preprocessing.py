@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# The MIT License
+
+# Copyright (c) 2021 Ina (David Doukhan - http://www.ina.fr/)
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import unittest
+import cv2
+import numpy as np
+from inaFaceAnalyzer.face_preprocessing import preprocess_face, normalize_bboxes, face_matrices, _align_crop_matrix, alignCrop
+from inaFaceAnalyzer.rect import Rect
+
+
+class TestPreprocessing(unittest.TestCase):
+
+    def test_preprocess_out(self):
+        frame = np.random.randint(0, 255, (300, 400, 3), dtype=np.uint8)
+        ref, refbb = preprocess_face(frame, Rect(50, 60, 210, 250), True, 1.1, None, (224, 224))
+        buf = np.zeros((2, 224, 224, 3), dtype=np.uint8)
+        img, bb = preprocess_face(frame, Rect(50, 60, 210, 250), True, 1.1, None, (224, 224), out=buf[1])
+        self.assertTrue(np.shares_memory(img, buf))
+        np.testing.assert_array_equal(ref, buf[1])
+        np.testing.assert_array_equal(0, buf[0])
+        self.assertEqual(refbb, bb)
+
+    def test_preprocess_out_dtype(self):
+        # out should be filled even if opencv cannot write directly into it
+        frame = np.random.randint(0, 255, (300, 400, 3)).astype(np.float32)
+        buf = np.zeros((1, 224, 224, 3), dtype=np.uint8)
+        img, _ = preprocess_face(frame, Rect(50, 60, 210, 250), True, 1.1, None, (224, 224), out=buf[0])
+        self.assertTrue(np.shares_memory(img, buf))
+        self.assertGreater(buf.max(), 0)
+
+    def test_normalize_bboxes(self):
+        lbbox = [Rect(50, 60, 210, 250), Rect(-3.5, 10.25, 40.5, 31), Rect(0.5, 0.5, 11.5, 11.5)]
+        for squarify in [True, False]:
+            ret = normalize_bboxes(lbbox, squarify, 1.1)
+            ref = [(e.square if squarify else e).scale(1.1).to_int() for e in lbbox]
+            self.assertEqual([Rect(*e) for e in ret.tolist()], ref)
+
+    def test_face_matrices(self):
+        bboxes = np.array([[50, 60, 210, 250], [-3, 10, 41, 31], [5, 5, 17, 17]])
+        leyes = [((90, 120), (170, 110)), ((10, 15), (10, 25)), ((8, 12), (14, 12))]
+        ret = face_matrices(bboxes, leyes, (224, 112))
+        for M, bb, (le, re) in zip(ret, bboxes, leyes):
+            fx, fy = 224 / (bb[2] - bb[0]), 112 / (bb[3] - bb[1])
+            ref = np.diag([fx, fy]) @ _align_crop_matrix(bb, le, re)
+            ref[:, 2] += [(fx - 1) / 2, (fy - 1) / 2]
+            np.testing.assert_allclose(M, ref, atol=1e-9)
+        ret = face_matrices(bboxes, None, None)
+        np.testing.assert_array_equal(ret[1], [[1, 0, 3], [0, 1, -10]])
+
+    def test_warp_vs_crop_resize(self):
+        # the single warp should match the former crop (or alignCrop) + resize
+        # pipeline on smooth images: crop borders may differ slightly since
+        # the warp interpolates with pixels outside the bounding box
+        rs = np.random.RandomState(0)
+        frame = cv2.GaussianBlur(rs.randint(0, 256, (480, 640, 3)).astype(np.uint8), (0, 0), 3)
+        eyes = lambda f, bb: ((bb.x1 + bb.w * .3, bb.y1 + bb.h * .4), (bb.x1 + bb.w * .7, bb.y1 + bb.h * .35))
+        for bb in [Rect(100, 80, 260, 260), Rect(300, 100, 380, 190), Rect(200, 150, 500, 420), Rect(400, 300, 430, 330)]:
+            img, nbb = preprocess_face(frame, bb, True, 1.1, None, (224, 224))
+            ref = cv2.resize(frame[nbb.y1:nbb.y2, nbb.x1:nbb.x2], (224, 224))
+            diff = np.abs(ref.astype(int) - img)
+            self.assertLessEqual(diff[8:-8, 8:-8].max(), 1)
+            self.assertLessEqual(diff.max(), 3)
+            img, nbb = preprocess_face(frame, bb, True, 1.1, eyes, (224, 224))
+            ref = cv2.resize(alignCrop(frame, nbb, *eyes(frame, bb)), (224, 224))
+            diff = np.abs(ref.astype(int) - img)
+            self.assertLessEqual(diff.max(), 3)
+            self.assertLess(diff.mean(), .5)
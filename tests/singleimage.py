@@ -47,6 +47,16 @@ class TestImageAnalyzer(unittest.TestCase):
         self.assertAlmostEqual(df.sex_decfunc[0], -1.16580753, places=3)
         self.assertAlmostEqual(df.detect_conf[0], 0.99964356, places=3)
 
+    def test_image_noalignment(self):
+        classif = Vggface_LSVM_YTF()
+        classif.needs_alignment = False
+        gi = ImageAnalyzer(face_detector = OcvCnnFacedetector(padd_prct=0.),
+                         face_classifier = classif)
+        self.assertIsNone(gi.face_alignment)
+        df = gi('./media/Europa21_-_2.jpg')
+        self.assertEqual(len(df), 1)
+        self.assertEqual(df.bbox[0], (432, 246, 989, 803))
+
     def test_image_all_diallo_multioutput(self):
         gi = ImageAnalyzer(face_classifier = Resnet50FairFaceGRA(),
                            face_detector = OcvCnnFacedetector())
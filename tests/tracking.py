@@ -32,9 +32,10 @@ import numpy as np
 from inaFaceAnalyzer.inaFaceAnalyzer import VideoTracking, VideoAnalyzer
 from inaFaceAnalyzer.face_classifier import Resnet50FairFaceGRA, Vggface_LSVM_YTF, Resnet50FairFace
 from inaFaceAnalyzer.face_detector import OcvCnnFacedetector, LibFaceDetection
-from inaFaceAnalyzer.face_tracking import Tracker
+from inaFaceAnalyzer.face_tracking import Tracker, TrackerDetector, TrackDetection
 from inaFaceAnalyzer.opencv_utils import imread_rgb
 from inaFaceAnalyzer.rect import Rect
+from tests.pipeline import MeanClassifier
 
 _vid = './media/pexels-artem-podrez-5725953.mp4'
 
@@ -50,6 +51,13 @@ class TestTracking(unittest.TestCase):
         trackbb = Rect.from_dlib(t.t.get_position())
         np.testing.assert_almost_equal(bb, trackbb)
 
+    def test_trackerdetector_nofaces(self):
+        frame = imread_rgb('./media/800px-India_(236650352).jpg')
+        td = TrackerDetector(lambda x, y: [], 2)
+        td.d[0] = Tracker(frame, Rect(100, 100, 200, 200), 0.99)
+        self.assertEqual(td(frame), [])
+        self.assertEqual(len(td.d), 0)
+
     # dlib's tracking is OS and/or architecture dependent
     @unittest.expectedFailure
     def test_tracker_updatebb(self):
@@ -83,6 +91,28 @@ class TestTracking(unittest.TestCase):
         assert_frame_equal(dfref, dfpred, atol=.01, check_dtype=False)
 
 
+    def test_tracking_eyes(self):
+        gt = VideoTracking(5, face_classifier=MeanClassifier(), face_detector=lambda x, y: [])
+        lbbox = []
+        def face_alignment(frame, bbox):
+            lbbox.append(bbox)
+            return (bbox.x1 + 10, bbox.y1 + 20), (bbox.x1 + 30, bbox.y1 + 20)
+        gt.face_alignment = face_alignment
+        gt._tracked_eyes = {}
+        # detection frame: eyes are detected
+        gt._detect_eyes(None, [TrackDetection(Rect(0, 0, 40, 40), 0, .9, None),
+                               TrackDetection(Rect(100, 100, 140, 140), 1, .9, None)])
+        self.assertEqual(len(lbbox), 2)
+        # tracked frame: face 0 is translated and twice larger, face 1 is lost
+        ret = gt._detect_eyes(None, [TrackDetection(Rect(5, 10, 85, 90), 0, None, 8.)])
+        self.assertEqual(len(lbbox), 2)
+        np.testing.assert_allclose(ret[0], [(25, 50), (65, 50)])
+        self.assertEqual(list(gt._tracked_eyes), [0])
+        # next detection frame
+        ret = gt._detect_eyes(None, [TrackDetection(Rect(5, 10, 85, 90), 0, .9, None)])
+        self.assertEqual(lbbox[-1], Rect(5, 10, 85, 90))
+        self.assertEqual(ret[0], ((15, 30), (35, 30)))
+
     def test_tracking_nofaces(self):
         gv = VideoTracking(5, face_classifier=Resnet50FairFaceGRA(), face_detector=lambda x, y: [])
         df = gv(_vid, fps=3)
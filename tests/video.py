@@ -31,6 +31,7 @@ import tensorflow as tf
 from inaFaceAnalyzer.inaFaceAnalyzer import VideoAnalyzer, VideoPrecomputedDetection, VideoKeyframes
 from inaFaceAnalyzer.face_classifier import Resnet50FairFace, Resnet50FairFaceGRA, Vggface_LSVM_YTF
 from inaFaceAnalyzer.face_detector import LibFaceDetection, PrecomputedDetector, OcvCnnFacedetector
+from inaFaceAnalyzer.pyav_utils import video_keyframes_iterator, video_keyframes_seek
 
 _vid = './media/pexels-artem-podrez-5725953.mp4'
 _ocvfd = OcvCnnFacedetector()
@@ -69,6 +70,13 @@ class TestVideo(unittest.TestCase):
         refdf = refdf.reset_index(drop = True)
         assert_frame_equal(refdf, ret, rtol=.01, check_dtype=False)
 
+    def test_video_keyframes_seek(self):
+        ref = dict(video_keyframes_iterator(_vid))
+        ret = list(video_keyframes_seek(_vid, [91, 273]))
+        self.assertEqual([e[0] for e in ret], [91, 273])
+        for iframe, frame in ret:
+            np.testing.assert_array_equal(frame, ref[iframe])
+
     # TODO: update with serialized ouput!
     def test_video_res50(self):
         gv = VideoAnalyzer(face_classifier=Resnet50FairFace(), face_detector=_ocvfd)